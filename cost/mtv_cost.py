@@ -1,17 +1,16 @@
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 
-from docplex.mp.model import Model
 from collections import Counter 
 from typing import Union, Dict, Optional, List
-from qiskit_optimization.translators import from_docplex_mp
 from qiskit_optimization.algorithms import OptimizationResult
 from qiskit_optimization.problems.quadratic_program import QuadraticProgram
 from qiskit_optimization.applications.graph_optimization_application import GraphOptimizationApplication
-       
-        
+
+
 class MTVcost(GraphOptimizationApplication):
     """
     A class that defines the Hamiltonian cost function for multivariate (MTV) porous material design.
@@ -26,13 +25,17 @@ class MTVcost(GraphOptimizationApplication):
         lengths (dict):  A dictionary mapping each linker type to its characteristic length.
         E (float, optional): A scaling factor for the balance constraint in the cost function. Default is 1.
     """
+    _MAX_TABLE_LINKERS = 16
+
     def __init__(self, G: nx.Graph, required_counts, linkers, lengths, E: float = 1):
         self.G = G
         self.required_counts = required_counts
         self.linkers = linkers
         self.lengths = lengths
         self.E = E
-        
+        self._parts_cache = None
+        self._decode_cache = None
+
     def to_quadratic_program(self) -> QuadraticProgram:
         """
         Constructs the quadratic optimization problem for MTV material design.
@@ -42,41 +45,111 @@ class MTVcost(GraphOptimizationApplication):
         based on minimizing the deviation from required linker counts, ensuring 
         structural balance, and enforcing occupancy constraints.
 
+        The cost terms that do not depend on ``E`` are cached on the graph and linker
+        specification, so repeated calls, including sweeps over ``E``, only rescale the
+        balance part. Every call returns a new QuadraticProgram.
+
         Returns:
             QuadraticProgram: The formulated quadratic optimization problem ready for
                               quantum or classical solvers.
-        """
-        mdl = Model(name="MTV Porous Material Cost Function")
 
-        q = {f'q_{i}_{t}': mdl.binary_var(name=f'q_{i}_{t}') for i in range(self.G.number_of_nodes()) for t in self.linkers}
-        
-        ratio_cost = 200 * mdl.sum((mdl.sum(q[f'q_{i}_{t}'] for i in range(self.G.number_of_nodes())) - self.required_counts[t])**2 for t in self.linkers)
-        
-        edge_values = {}
-        balance_cost_terms = []
+        Raises:
+            ValueError: If the graph has no edges, since the balance cost averages over edges.
+        """
+        if self.G.number_of_edges() == 0:
+            raise ValueError("The balance cost is undefined for a graph without edges.")
 
-        for (i, j, d) in self.G.edges(data=True):
-            edge_values[(i, j)] = mdl.sum(
-                self.lengths[t1] * q[f'q_{i}_{t1}'] + self.lengths[t2] * q[f'q_{j}_{t2}']
-                for t1 in self.linkers for t2 in self.linkers
-            )
+        key = self._cache_key()
+        if self._parts_cache is None or self._parts_cache[0] != key:
+            self._parts_cache = (key, self._cost_parts())
+        fixed_quad, balance_quad, linear, constant = self._parts_cache[1]
 
-        mean_edge_value = mdl.sum(edge_values[(i, j)] for (i, j) in self.G.edges) / len(self.G.edges)
+        quadratic = fixed_quad + self.E * balance_quad
 
-        for (i, j) in self.G.edges:
-            balance_cost_terms.append(
-                self.G.edges[i, j]["weight"] * (edge_values[(i, j)] - mean_edge_value) ** 2
-            )
-        
-        balance_cost = mdl.sum(balance_cost_terms)
+        # q^2 = q for binaries: move the diagonal into the linear part and keep the strict upper triangle.
+        linear = linear + quadratic.diagonal()
+        quadratic = sp.triu(quadratic + quadratic.T, k=1, format="csr")
 
-        occupancy_cost = 300 * mdl.sum((mdl.sum(q[f'q_{i}_{t}'] for t in self.linkers) - 1) ** 2 for i in range(self.G.number_of_nodes()))
+        num_sites = self.G.number_of_nodes()
+        qp = QuadraticProgram(name="MTV Porous Material Cost Function")
+        qp.binary_var_list([f'{i}_{t}' for i in range(num_sites) for t in self.linkers], name="q", key_format="_{}")
+        qp.minimize(constant=constant, linear=linear, quadratic=quadratic)
+        return qp
 
-        total_cost = ratio_cost + self.E * balance_cost + occupancy_cost
-        mdl.minimize(total_cost)
+    def _cost_parts(self) -> tuple:
+        """
+        Assembles the cost terms that do not depend on ``E``.
 
-        op = from_docplex_mp(mdl)
-        return op
+        Returns:
+            tuple: The ratio plus occupancy quadratic matrix, the unscaled balance quadratic
+                   matrix, and the linear vector and constant of the ratio and occupancy terms.
+        """
+        num_sites = self.G.number_of_nodes()
+        num_linkers = len(self.linkers)
+        num_vars = num_sites * num_linkers
+        lengths_vec = np.array([self.lengths[t] for t in self.linkers], dtype=np.float64)
+        required_vec = np.array([self.required_counts[t] for t in self.linkers], dtype=np.float64)
+
+        # Variable q_{i}_{t} lives at index i * num_linkers + t_idx.
+        index = np.arange(num_vars).reshape(num_sites, num_linkers)
+
+        # ratio_cost = 200 * sum_t (sum_i q_{i,t} - r_t)^2 couples every pair of sites per linker.
+        ratio_rows = np.broadcast_to(index[:, None, :], (num_sites, num_sites, num_linkers)).ravel()
+        ratio_cols = np.broadcast_to(index[None, :, :], (num_sites, num_sites, num_linkers)).ravel()
+        ratio_lin = np.tile(-400 * required_vec, num_sites)
+        ratio_const = 200 * np.sum(required_vec ** 2)
+
+        # occupancy_cost = 300 * sum_i (sum_t q_{i,t} - 1)^2 couples every pair of linkers per site.
+        occupancy_rows = np.broadcast_to(index[:, :, None], (num_sites, num_linkers, num_linkers)).ravel()
+        occupancy_cols = np.broadcast_to(index[:, None, :], (num_sites, num_linkers, num_linkers)).ravel()
+        occupancy_lin = np.full(num_vars, -600.0)
+        occupancy_const = 300.0 * num_sites
+
+        fixed_quad = sp.coo_matrix(
+            (
+                np.concatenate([
+                    np.full(ratio_rows.size, 200.0),
+                    np.full(occupancy_rows.size, 300.0),
+                ]),
+                (np.concatenate([ratio_rows, occupancy_rows]), np.concatenate([ratio_cols, occupancy_cols])),
+            ),
+            shape=(num_vars, num_vars),
+        ).tocsr()
+
+        # balance_cost = sum_e w_e (x_e - mean_e x)^2 with x = A q, where row e of A holds
+        # the length contributions of both end sites of edge e.
+        edges = list(self.G.edges(data="weight"))
+        num_edges = len(edges)
+        ends = np.array([(i, j) for i, j, _ in edges], dtype=np.int64).reshape(num_edges, 2)
+        weights = np.array([w for _, _, w in edges], dtype=np.float64)
+        a_cols = (ends[:, :, None] * num_linkers + np.arange(num_linkers)).ravel()
+        a_rows = np.repeat(np.arange(num_edges), 2 * num_linkers)
+        a_data = np.tile(num_linkers * lengths_vec, 2 * num_edges)
+        A = sp.csr_matrix((a_data, (a_rows, a_cols)), shape=(num_edges, num_vars))
+        balance_quad = (A.T @ sp.diags(weights) @ A).tocsr()
+
+        # Expanding the square around the mean x_bar = m^T q with m = A^T 1 / |E| adds the dense
+        # rank-1 terms -(s m^T + m s^T) + sum(w) m m^T to A^T W A, where s = A^T w.
+        edge_mean = np.asarray(A.sum(axis=0)).ravel() / num_edges
+        weighted_sum = A.T @ weights
+        cross = np.outer(weighted_sum, edge_mean)
+        balance_quad = sp.csr_matrix(
+            balance_quad + weights.sum() * np.outer(edge_mean, edge_mean) - cross - cross.T
+        )
+
+        return fixed_quad, balance_quad, ratio_lin + occupancy_lin, ratio_const + occupancy_const
+
+    def _cache_key(self) -> tuple:
+        """
+        Returns a hashable key describing every input of ``to_quadratic_program`` except ``E``.
+        """
+        return (
+            tuple(sorted(self.G.edges(data="weight"))),
+            self.G.number_of_nodes(),
+            tuple(self.linkers),
+            tuple(self.lengths[t] for t in self.linkers),
+            tuple(self.required_counts[t] for t in self.linkers),
+        )
 
     def interpret(self, result: OptimizationResult) -> List[str]:
         """
@@ -91,20 +164,10 @@ class MTVcost(GraphOptimizationApplication):
         Returns:
             List[str]: A list representing the linker assignments for each site.
         """
-        num_sites = self.G.number_of_nodes()  
-        num_linkers = len(self.linkers)  
-        interpreted_result = []
-
-        bitstring = ''.join(map(str, result.x.astype(int)))
-
-        for i in range(num_sites):
-            start_idx = i * num_linkers
-            end_idx = start_idx + num_linkers
-            site_encoding = bitstring[start_idx:end_idx]
-
-            assigned_linkers = [self.linkers[j] for j, bit in enumerate(site_encoding) if bit == '1']
-            interpreted_result.append(",".join(assigned_linkers) if assigned_linkers else "-")  
-        return interpreted_result
+        num_sites = self.G.number_of_nodes()
+        num_linkers = len(self.linkers)
+        # Trailing variables beyond the site encodings (e.g. slack bits) are ignored.
+        return self._site_labels(result.x[:num_sites * num_linkers].reshape(num_sites, num_linkers))
     
     def _draw_result(self, result: OptimizationResult, pos: Optional[Dict[int, np.ndarray]] = None) -> None:
         """
@@ -159,7 +222,55 @@ class MTVcost(GraphOptimizationApplication):
                 node_colors.append("gray")  
         return node_colors
 
-    def plot_distribution(self, samples):
+    def _decode_tables(self) -> tuple:
+        """
+        Returns the linker names, per-linker bit values and site-label table for the current linkers.
+
+        The tables are built on first use and rebuilt whenever ``self.linkers`` changes. Above
+        ``_MAX_TABLE_LINKERS`` linker types the 2^L label table is not built and the bit values
+        and table are returned as None.
+        """
+        linkers = tuple(self.linkers)
+        if self._decode_cache is None or self._decode_cache[0] != linkers:
+            linkers_arr = np.array(linkers, dtype=object)
+            if len(linkers) <= self._MAX_TABLE_LINKERS:
+                powers = 1 << np.arange(len(linkers), dtype=np.uint32)
+                table = self._site_label_table(linkers_arr)
+            else:
+                powers, table = None, None
+            self._decode_cache = (linkers, linkers_arr, powers, table)
+        return self._decode_cache[1:]
+
+    def _site_labels(self, bits: np.ndarray) -> List[str]:
+        """
+        Returns the linker label of every site.
+
+        Args:
+            bits (np.ndarray): Site encodings of shape (num_sites, num_linkers).
+
+        Returns:
+            List[str]: The assigned linkers of each site joined by commas, or "-" for an empty site.
+        """
+        linkers_arr, powers, table = self._decode_tables()
+        if table is None:
+            return [",".join(linkers_arr[row].tolist()) or "-" for row in bits.astype(bool)]
+        return table[bits.astype(np.uint8) @ powers].tolist()
+
+    @staticmethod
+    def _site_label_table(linkers_arr: np.ndarray) -> np.ndarray:
+        """
+        Returns the label of every possible site encoding, indexed by its integer code.
+
+        Bit ``t`` of a code marks the presence of ``linkers_arr[t]`` at a site.
+        """
+        num_linkers = len(linkers_arr)
+        codes = np.arange(1 << num_linkers)
+        present = (codes[:, None] >> np.arange(num_linkers)) & 1
+        return np.array(
+            [",".join(linkers_arr[row.astype(bool)].tolist()) or "-" for row in present], dtype=object
+        )
+
+    def plot_distribution(self, samples, top_k: int = 20):
         """
         Plots a histogram of linker configurations based on bitstring probabilities.
 
@@ -168,19 +279,26 @@ class MTVcost(GraphOptimizationApplication):
 
         Args:
             samples: The sampled bitstrings and their corresponding probabilities.
+            top_k (int, optional): Number of most probable configurations to plot. Default is 20.
         """
-        configurations = []
-        probabilities = []
-
-        for sample in samples:
-            bitstring = ''.join(map(str, sample.x.astype(int)))  
-            interpreted = self.interpret(sample)  
-            configurations.append(str(interpreted))  
-            probabilities.append(sample.probability) 
-
-        sorted_indices = sorted(range(len(probabilities)), key=lambda k: probabilities[k], reverse=True)
-        configurations = [configurations[i] for i in sorted_indices]
-        probabilities = [probabilities[i] for i in sorted_indices]
+        num_sites = self.G.number_of_nodes()
+        num_linkers = len(self.linkers)
+
+        configurations, probabilities = [], []
+        if len(samples) > 0:
+            bits = np.stack([sample.x[:num_sites * num_linkers] for sample in samples]).astype(np.uint8)
+            probabilities = np.array([sample.probability for sample in samples], dtype=np.float64)
+
+            # Samples that decode to the same configuration share a bit row; merge them before
+            # sorting and only build labels for the configurations that are plotted.
+            unique_bits, first_index, inverse = np.unique(bits, axis=0, return_index=True, return_inverse=True)
+            aggregated = np.bincount(inverse.ravel(), weights=probabilities, minlength=len(unique_bits))
+            top = np.lexsort((first_index, -aggregated))[:top_k]
+
+            configurations = [
+                str(self._site_labels(row.reshape(num_sites, num_linkers))) for row in unique_bits[top]
+            ]
+            probabilities = aggregated[top]
 
         plt.figure(figsize=(12, 6))
         plt.bar(range(len(configurations)), probabilities, tick_label=configurations)
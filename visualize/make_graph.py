@@ -2,6 +2,25 @@ import matplotlib.pyplot as plt
 import numpy as np
 import networkx as nx
 import matplotlib.lines as mlines
+import weakref
+
+_layout_cache = weakref.WeakKeyDictionary()
+
+def _spring_layout(G):
+    """
+    Returns a spring layout for G, reusing the previous one while the graph's structure is unchanged.
+
+    Layouts are kept in a module-level weak cache, so nothing is written to G itself.
+
+    Args:
+        G (networkx.Graph): The graph to lay out.
+    """
+    signature = (tuple(G.nodes()), frozenset(G.edges()))
+    cached = _layout_cache.get(G)
+    if cached is None or cached[0] != signature:
+        cached = (signature, nx.spring_layout(G))
+        _layout_cache[G] = cached
+    return cached[1]
 
 def draw_graph(G, colors=None, pos=None, figsize=(6, 4), output_path=None):
     """
@@ -15,7 +34,7 @@ def draw_graph(G, colors=None, pos=None, figsize=(6, 4), output_path=None):
         output_path (str, optional): Path to save the figure (optional).
     """
     if pos is None:
-        pos = nx.spring_layout(G) 
+        pos = _spring_layout(G)
 
     fig, ax = plt.subplots(figsize=figsize)  
 
@@ -25,27 +44,27 @@ def draw_graph(G, colors=None, pos=None, figsize=(6, 4), output_path=None):
     nx.draw_networkx_nodes(G, pos, node_color=colors, node_size=600, ax=ax)
     nx.draw_networkx_labels(G, pos, ax=ax)
 
-    edge_weights = nx.get_edge_attributes(G, 'weight')
-    unique_weights = sorted(set(edge_weights.values())) 
-    num_weights = len(unique_weights)
+    edge_weights = [weight for _, _, weight in G.edges(data='weight')]
+    weights_arr = np.array(edge_weights, dtype=np.float64)
+    _, first_index, inverse = np.unique(weights_arr, return_index=True, return_inverse=True)
+    num_weights = len(first_index)
 
     cmap = plt.get_cmap('coolwarm', num_weights)
-    weight_to_color = {weight: cmap(i / max(1, num_weights - 1)) for i, weight in enumerate(unique_weights)}
-
-    for (u, v, weight) in G.edges(data='weight'):
-        nx.draw_networkx_edges(
-            G,
-            pos,
-            edgelist=[(u, v)],
-            edge_color=[weight_to_color[weight]],
-            width=2,
-            ax=ax
-        )
+    colors_arr = cmap(np.arange(num_weights) / max(1, num_weights - 1))
+
+    nx.draw_networkx_edges(
+        G,
+        pos,
+        edgelist=list(G.edges()),
+        edge_color=colors_arr[inverse],
+        width=2,
+        ax=ax
+    )
    
     legend_lines = [
         mlines.Line2D(
-            [], [], color=weight_to_color[w], linewidth=2, label=f"{w}"
-        ) for w in unique_weights
+            [], [], color=color, linewidth=2, label=f"{w}"
+        ) for w, color in zip((edge_weights[k] for k in first_index), colors_arr)
     ]
     ax.legend(handles=legend_lines, title="Edge Weights", loc="upper right", fontsize=10)
     